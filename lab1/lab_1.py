@@ -1,10 +1,271 @@
+import os
+import mmap
 import tkinter as tk
 from tkinter import messagebox
-from math import sqrt
-from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import NamedTuple
+import numpy as np
 from PIL import ImageTk
 
 
+def linear_batch(a, b, c):
+    ''' y1 = cbrt(5 + c * (b + 5 * sqrt(a))) for arrays of a, b, c,
+        real cube root, so negative radicand gives negative y1 '''
+    a, b, c = np.asarray(a, float), np.asarray(b, float), np.asarray(c, float)
+    with np.errstate(invalid='ignore'):
+        return np.cbrt(5 + c * (b + 5 * np.sqrt(a)))
+
+
+def branch_batch(k, d):
+    ''' y2 = sqrt(k|d| + d|k|) where k > 10, else (k + d) ** 2 '''
+    k, d = np.asarray(k, float), np.asarray(d, float)
+    with np.errstate(invalid='ignore'):
+        return np.where(k > 10,
+                        np.sqrt(k * np.abs(d) + d * np.abs(k)),
+                        (k + d) ** 2)
+
+
+def cycle_batch(a, b):
+    ''' F = prod(a[i] + b[i+1]) + sum(a[i+1] * b[i])
+
+        a and b may be 1-D (one case) or 2-D (one case per row),
+        pairs are taken over the last axis '''
+    a, b = np.asarray(a, float), np.asarray(b, float)
+    m1 = min(a.shape[-1], b.shape[-1] - 1)
+    m2 = min(a.shape[-1] - 1, b.shape[-1])
+    f1 = np.prod(a[..., :m1] + b[..., 1:m1 + 1], axis=-1)
+    f2 = np.sum(a[..., 1:m2 + 1] * b[..., :m2], axis=-1)
+    return f1 + f2
+
+
+class CycleResult(NamedTuple):
+    ''' F parts with f1 kept as mantissa * 2 ** exponent '''
+    mantissa: float
+    exponent: int
+    f2: float
+
+    @property
+    def f1(self):
+        with np.errstate(over='ignore'):
+            return float(np.ldexp(self.mantissa, self.exponent))
+
+    @property
+    def log_abs_f1(self):
+        ''' ln|f1|, finite even when f1 itself overflows '''
+        with np.errstate(divide='ignore'):
+            return float(np.log(abs(self.mantissa))) + self.exponent * np.log(2)
+
+    @property
+    def F(self):
+        return self.f1 + self.f2
+
+
+def _scaled_prod(x, block=512):
+    ''' Product of x as (mantissa, exponent), renormalized every block
+        factors so it never overflows or underflows '''
+    mantissa, exponents = np.frexp(np.asarray(x, float))
+    exponent = int(exponents.sum())
+    while mantissa.size > 1:
+        pad = np.ones(-mantissa.size % block)
+        mantissa = (np.concatenate([mantissa, pad])
+                      .reshape(-1, block).prod(axis=1))
+        mantissa, exponents = np.frexp(mantissa)
+        exponent += int(exponents.sum())
+    return (float(mantissa[0]) if mantissa.size else 1.), exponent
+
+
+def load_array(path):
+    ''' Maps a .npy or raw float64 file into memory without reading it '''
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=np.float64, mode='r')
+
+
+def parse_cycle_arg(text):
+    ''' cycle array from a .npy/raw float64 file path or `x1,x2,...` '''
+    text = text.strip()
+    if os.path.isfile(text):
+        return load_array(text)
+    return np.array(text.split(','), dtype=np.float64)
+
+
+def _source(arr):
+    ''' Describes a float64 file-backed memmap as ('file', path, offset, size),
+        workers then map the same file instead of getting a copy '''
+    if (isinstance(arr, np.memmap) and isinstance(arr.base, mmap.mmap)
+            and arr.dtype == np.float64 and arr.ndim == 1):
+        return 'file', arr.filename, arr.offset, arr.size
+    return None
+
+
+def _open_source(source):
+    ''' Returns (array, shared memory handle or None) for a source '''
+    kind, name, offset, size = source
+    if size == 0:
+        return np.empty(0), None
+    if kind == 'file':
+        return np.memmap(name, dtype=np.float64, mode='r',
+                         offset=offset, shape=(size,)), None
+    shm = shared_memory.SharedMemory(name=name)
+    return np.ndarray(size, dtype=np.float64,
+                      buffer=shm.buf, offset=offset), shm
+
+
+def _cycle_partials(a, b, lo1, hi1, lo2, hi2, scaled):
+    ''' Partial product and partial sum of F over one chunk of indices,
+        pairs are zero-copy slices a with b[1:] and a[1:] with b '''
+    factors = a[lo1:hi1] + b[lo1 + 1:hi1 + 1]
+    if scaled:
+        part = _scaled_prod(factors)
+    else:
+        part = float(np.prod(factors)), 0
+    return part, float(np.dot(a[lo2 + 1:hi2 + 1], b[lo2:hi2]))
+
+
+def _cycle_chunk(source_a, source_b, *chunk):
+    a, shm_a = _open_source(source_a)
+    b, shm_b = _open_source(source_b)
+    try:
+        return _cycle_partials(a, b, *chunk)
+    finally:
+        del a, b
+        for shm in (shm_a, shm_b):
+            if shm is not None:
+                shm.close()
+
+
+def cycle_reduce(a, b, workers=None, chunk_size=1 << 22, scaled=False):
+    ''' Computes F = f1 + f2 of cycle by chunks in a process pool.
+
+        File-backed memmaps (see load_array) are mapped by every worker,
+        other arrays are placed once in shared memory. Every chunk is reduced
+        to a partial product and a partial sum, which are combined afterwards.
+        workers=1 reduces the chunks in this process.
+        With scaled=True products are accumulated as mantissa * 2 ** exponent,
+        so f1 does not overflow to inf.
+        Returns CycleResult '''
+    if _source(a) is None:
+        a = np.ascontiguousarray(a, dtype=np.float64).ravel()
+    if _source(b) is None:
+        b = np.ascontiguousarray(b, dtype=np.float64).ravel()
+    m1 = max(min(a.size, b.size - 1), 0)
+    m2 = max(min(a.size - 1, b.size), 0)
+    n_chunks = max(1, -(-max(m1, m2) // chunk_size))
+    bounds = [i * chunk_size for i in range(n_chunks)] + [max(m1, m2)]
+    chunks = [(min(lo, m1), min(hi, m1), min(lo, m2), min(hi, m2), scaled)
+              for lo, hi in zip(bounds, bounds[1:])]
+
+    if workers == 1:
+        partials = [_cycle_partials(a, b, *chunk) for chunk in chunks]
+    else:
+        in_memory = [arr for arr in (a, b) if _source(arr) is None]
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(sum(arr.nbytes for arr in in_memory), 8))
+        try:
+            sources, offset = [], 0
+            for arr in (a, b):
+                source = _source(arr)
+                if source is None:
+                    np.ndarray(arr.size, dtype=np.float64, buffer=shm.buf,
+                               offset=offset)[:] = arr
+                    source = 'shm', shm.name, offset, arr.size
+                    offset += arr.nbytes
+                sources.append(source)
+            with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+                partials = list(pool.map(
+                    _cycle_chunk,
+                    *zip(*[(*sources, *chunk) for chunk in chunks])))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    parts, totals = zip(*partials)
+    mantissas, exponents = zip(*parts)
+    if scaled:
+        mantissa, exponent = _scaled_prod(mantissas)
+        exponent += sum(exponents)
+    else:
+        mantissa, exponent = float(np.prod(mantissas)), 0
+    return CycleResult(mantissa, exponent, sum(totals))
+
+
+RECORD_KINDS = ('linear', 'branch', 'cycle')
+
+
+def parse_record(line):
+    ''' Parses one `linear`/`branch`/`cycle` record into (kind, values) '''
+    line = line.strip()
+    if not line:
+        return None
+    for kind in RECORD_KINDS:
+        if line.startswith(kind):
+            data = line[len(kind):]
+            if kind == 'cycle':
+                a, b = data.split(';')
+                return kind, (parse_cycle_arg(a), parse_cycle_arg(b))
+            return kind, [float(num) for num in data.split(',')]
+    raise ValueError(f'Unknown record: {line[:20]}')
+
+
+def iter_records(path, chunk_size=1 << 20):
+    ''' Reads a file of records (one per line) in fixed-size chunks
+        and yields them one by one, only a partial line is kept
+        between chunks '''
+    tail = ''
+    with open(path, 'r') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split('\n')
+            tail = lines.pop()
+            for line in lines:
+                record = parse_record(line)
+                if record:
+                    yield record
+    record = parse_record(tail)
+    if record:
+        yield record
+
+
+def _compute_records(kind, batch):
+    if kind == 'linear':
+        return linear_batch(*np.array(batch).T)
+    if kind == 'branch':
+        return branch_batch(*np.array(batch).T)
+    return [cycle_reduce(a, b, scaled=True).F
+            if isinstance(a, np.memmap) or isinstance(b, np.memmap)
+            else cycle_batch(a, b)
+            for a, b in batch]
+
+
+def stream_file(in_path, out_path, chunk_size=1 << 20, batch_size=4096):
+    ''' Computes every record of in_path and writes `kind result` lines
+        to out_path as it goes.
+
+        Consecutive records of one kind are batched (up to batch_size)
+        into a single kernel call, so memory does not depend on file size.
+        Returns number of records processed '''
+    count = 0
+    with open(out_path, 'w') as out:
+        def flush(kind, batch):
+            out.writelines(f'{kind} {float(y)!r}\n'
+                           for y in _compute_records(kind, batch))
+
+        kind, batch = None, []
+        for record_kind, values in iter_records(in_path, chunk_size):
+            if batch and (record_kind != kind or len(batch) >= batch_size):
+                flush(kind, batch)
+                batch = []
+            kind = record_kind
+            batch.append(values)
+            count += 1
+        if batch:
+            flush(kind, batch)
+    return count
+
+
 class MyWindow:
     def __init__(self, master):
         self.master = master
@@ -15,6 +276,9 @@ class MyWindow:
         self.read_file = tk.Button(
             self.frame, command=self.read, text='Read file input.txt')
         self.from_file = False
+        self.stream_file = tk.Button(
+            self.frame, command=self.stream,
+            text='Stream input.txt to output.txt')
 
         self.lbl_linear = tk.Label(
             self.frame, text='Linear <== a, b, c:', height=3, width=20)
@@ -61,6 +325,7 @@ class MyWindow:
            .grid(row=7, column=0, columnspan=4))
         self.btn_show_variant.grid(row=10, column=0, columnspan=4)
         self.read_file.grid(row=11, column=0, columnspan=4)
+        self.stream_file.grid(row=12, column=0, columnspan=4)
 
     def read(self):
         self.from_file = True
@@ -72,6 +337,14 @@ class MyWindow:
         except Exception:
             messagebox.showerror('Error', 'Cannot read from input.txt')
 
+    def stream(self):
+        try:
+            count = stream_file('input.txt', 'output.txt')
+            messagebox.showinfo(
+                'Success', f'Wrote {count} results to output.txt')
+        except Exception:
+            messagebox.showerror('Error', 'Cannot process input.txt')
+
     def show_variant(self):
         window = tk.Toplevel(self.frame)
         window.title('My variant')
@@ -97,10 +370,12 @@ class MyWindow:
                 self.enter_a.insert(0, a)
                 self.enter_b.insert(0, b)
                 self.enter_c.insert(0, c)
-            y = (5 + c * (b + 5 * sqrt(a))) ** (1/3)
+            y = float(linear_batch(a, b, c))
+            if np.isnan(y):
+                raise ValueError('y1 is undefined')
             (tk.Label(self.frame, text=f'y1 = {y:.2f}')
                 .grid(row=1, column=1, columnspan=3))
-        except EnvironmentError:
+        except (EnvironmentError, ValueError):
             self.enter_a.delete(0, tk.END)
             self.enter_b.delete(0, tk.END)
             self.enter_c.delete(0, tk.END)
@@ -118,11 +393,14 @@ class MyWindow:
 
                 self.enter_k.insert(0, k)
                 self.enter_d.insert(0, d)
-            y = sqrt(k * abs(d) + d * abs(k)) if k > 10 else (k + d) ** 2
+            y = float(branch_batch(k, d))
+            if np.isnan(y):
+                raise ValueError('y2 is undefined')
         except Exception:
             self.enter_k.delete(0, tk.END)
             self.enter_d.delete(0, tk.END)
             messagebox.showerror('Error', 'Use correct values')
+            return
 
         (tk.Label(self.frame, text=f'y2 = {y:.2f}')
            .grid(row=3, column=1, columnspan=3))
@@ -130,30 +408,32 @@ class MyWindow:
     def cycle(self):
         try:
             if not self.from_file:
-                a = [float(x) for x in self.enter_arr_a.get().split(',')]
-                b = [float(x) for x in self.enter_arr_a.get().split(',')]
+                a = parse_cycle_arg(self.enter_arr_a.get())
+                b = parse_cycle_arg(self.enter_arr_b.get())
             elif self.file_input.startswith('cycle'):
                 data = self.file_input[5:].split(';')
-                a = [float(num) for num in data[0].split(',')]
-                b = [float(num) for num in data[1].split(',')]
+                a = parse_cycle_arg(data[0])
+                b = parse_cycle_arg(data[1])
                 self.from_file = False
 
                 self.enter_arr_a.insert(0, data[0])
                 self.enter_arr_b.insert(0, data[1])
-            f1 = reduce(lambda x, y: x * (y[0] + y[1]), (1, *list(zip(a, b[1:]))))
-            f2 = reduce(lambda x, y: x + (y[0] * y[1]), (0, *list(zip(a[1:], b))))
-            F = f1 + f2
+            if isinstance(a, np.memmap) or isinstance(b, np.memmap):
+                F = cycle_reduce(a, b, scaled=True).F
+            else:
+                F = float(cycle_batch(a, b))
         except Exception:
             self.enter_arr_a.delete(0, tk.END)
             self.enter_arr_b.delete(0, tk.END)
             messagebox.showerror('Error', 'Use correct values')
+            return
         (tk.Label(self.frame, text=f'F = {F:.2f}')
            .grid(row=6, column=1, columnspan=3))
 
 
 if __name__ == "__main__":
     root = tk.Tk()
-    root.geometry('260x420')
+    root.geometry('260x460')
     root.title('LAB 1')
     app = MyWindow(root)
     root.mainloop()
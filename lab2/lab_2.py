@@ -1,20 +1,489 @@
+import argparse
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import queue
+import threading
 import tkinter as tk
 import time
 import matplotlib
+import numpy as np
 from numpy import random
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,
                                                NavigationToolbar2Tk)
 from matplotlib.figure import Figure
 import matplotlib.animation as anim
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 
 matplotlib.use("TkAgg")
-random.seed(42)
+
+# Sort engines which can be benchmarked, by name
+SORT_ENGINES: Dict[str, Callable] = {}
+# Names of engines which take counters of comparisons, swaps and passes
+COUNTED_ENGINES: List[str] = []
+
+
+def register_engine(name: str, counted: bool = False) -> Callable:
+    '''Decorator which adds sort function to SORT_ENGINES
+    (and to COUNTED_ENGINES if it fills counters)'''
+    def register(sort: Callable) -> Callable:
+        SORT_ENGINES[name] = sort
+        if counted:
+            COUNTED_ENGINES.append(name)
+        return sort
+    return register
+
+
+@register_engine('shake', counted=True)
+def shake_sort(arr: list, counters: Optional[Dict[str, int]] = None) -> list:
+    up = range(len(arr) - 1)
+    swaps = passes = 0
+    while True:
+        for indices in (up, reversed(up)):
+            swapped = False
+            for i in indices:
+                if arr[i] > arr[i+1]:
+                    arr[i], arr[i+1] = arr[i+1], arr[i]
+                    swapped = True
+                    swaps += 1
+            passes += 1
+            if not swapped:
+                if counters is not None:
+                    counters.update(comparisons=passes * len(up),
+                                    swaps=swaps, passes=passes)
+                return arr
+
+
+@register_engine('cocktail', counted=True)
+def cocktail_sort(arr: list,
+                  counters: Optional[Dict[str, int]] = None) -> list:
+    '''Shaker sort which shrinks the scan window to the last swap position
+    on every pass, fills counters (if given) with numbers of
+    comparisons, swaps and passes'''
+    lo, hi = 0, len(arr) - 1
+    comparisons = swaps = passes = 0
+    while lo < hi:
+        last = lo
+        for i in range(lo, hi):
+            if arr[i] > arr[i+1]:
+                arr[i], arr[i+1] = arr[i+1], arr[i]
+                last = i
+                swaps += 1
+        comparisons += hi - lo
+        passes += 1
+        hi = last
+        if lo >= hi:
+            break
+
+        last = hi
+        for i in range(hi - 1, lo - 1, -1):
+            if arr[i] > arr[i+1]:
+                arr[i], arr[i+1] = arr[i+1], arr[i]
+                last = i + 1
+                swaps += 1
+        comparisons += hi - lo
+        passes += 1
+        lo = last
+
+    if counters is not None:
+        counters.update(comparisons=comparisons, swaps=swaps, passes=passes)
+    return arr
+
+
+@register_engine('counting')
+def counting_sort(arr: list) -> list:
+    '''O(n + k) sort of integers from a range of k values'''
+    if len(arr):
+        values = np.asarray(arr)
+        low = values.min()
+        counts = np.bincount(values - low)
+        arr[:] = np.repeat(np.arange(low, low + len(counts)), counts)
+    return arr
+
+
+@register_engine('numpy')
+def numpy_sort(arr: list) -> list:
+    if isinstance(arr, np.ndarray):
+        arr.sort(kind='stable')
+    else:
+        arr[:] = np.sort(arr, kind='stable')
+    return arr
+
+
+def make_sample(size: int, seed: int = 42) -> np.ndarray:
+    '''Unsorted test array, the same for every (size, seed)'''
+    return random.RandomState([seed, size]).randint(low=1, high=20, size=size)
+
+
+def measure(sort: Callable, sample: np.ndarray, repeats: int = 5,
+            warmup: int = 1, disable_gc: bool = True) -> List[float]:
+    '''Times sort on fresh copies of sample, returns times in ms'''
+    for _ in range(warmup):
+        sort(sample.copy())
+
+    gc_enabled = gc.isenabled()
+    if disable_gc:
+        gc.disable()
+    try:
+        times = []
+        for _ in range(repeats):
+            arr = sample.copy()
+            ts = time.perf_counter_ns()
+            sort(arr)
+            te = time.perf_counter_ns()
+            times.append((te - ts) / 1e6)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return times
+
+
+def summarize(size: int, times: List[float]) -> Dict[str, float]:
+    q1, med, q3 = np.percentile(times, [25, 50, 75])
+    return {'size': size, 'min': min(times),
+            'median': float(med), 'iqr': float(q3 - q1)}
+
+
+class MeasurementCache:
+    '''Bounded LRU cache of measurements keyed by cache_key(...),
+    can be persisted to a .json file between sessions'''
+    def __init__(self, max_size: int = 100000,
+                 path: Optional[str] = None) -> None:
+        self.max_size = max_size
+        self.path = path
+        self.lock = threading.Lock()
+        self.items: OrderedDict = OrderedDict()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key: Tuple, value: Dict) -> None:
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def save(self, path: Optional[str] = None) -> None:
+        with self.lock:
+            entries = [{'key': list(key), 'value': value}
+                       for key, value in self.items.items()]
+        with open(path or self.path, 'w') as file:
+            json.dump(entries, file)
+
+    def load(self, path: str) -> None:
+        with open(path) as file:
+            for entry in json.load(file):
+                self.put(tuple(entry['key']), entry['value'])
+
+
+# Suffix of pseudo engine names of operation counts, e.g. 'shake-ops'
+OPS_SUFFIX = '-ops'
+
+
+def ops_engine(engine: str) -> str:
+    return engine + OPS_SUFFIX
+
+
+def cache_key(engine: str, size: int, seed: int = 42, repeats: int = 5,
+              warmup: int = 1, disable_gc: bool = True) -> Tuple:
+    '''(size, seed, engine) for counters, times are also keyed by
+    how they were measured'''
+    if engine.endswith(OPS_SUFFIX):
+        return (size, seed, engine)
+    return (size, seed, engine, repeats, warmup, disable_gc)
+
+
+def cached_measure(engine: str, size: int, seed: int = 42, repeats: int = 5,
+                   warmup: int = 1, disable_gc: bool = True,
+                   cache: Optional[MeasurementCache] = None) -> Dict:
+    '''Summary of engine times on make_sample(size, seed),
+    measured only if it is not in cache yet'''
+    key = cache_key(engine, size, seed, repeats, warmup, disable_gc)
+    result = cache.get(key) if cache is not None else None
+    if result is None:
+        times = measure(SORT_ENGINES[engine], make_sample(size, seed),
+                        repeats, warmup, disable_gc)
+        result = summarize(size, times)
+        if cache is not None:
+            cache.put(key, result)
+    return result
+
+
+def cached_operations(engine: str, size: int, seed: int = 42,
+                      cache: Optional[MeasurementCache] = None) -> Dict:
+    '''Counters of counted engine for make_sample(size, seed),
+    cached under engine name ops_engine(engine)'''
+    key = cache_key(ops_engine(engine), size, seed)
+    counters = cache.get(key) if cache is not None else None
+    if counters is None:
+        counters = {}
+        SORT_ENGINES[engine](make_sample(size, seed), counters)
+        if cache is not None:
+            cache.put(key, counters)
+    return counters
+
+
+def run_task(engine: str, size: int, seed: int = 42, repeats: int = 5,
+             warmup: int = 1, disable_gc: bool = True,
+             cache: Optional[MeasurementCache] = None) -> Dict:
+    '''Times summary of engine or counters if engine is ops_engine(...)'''
+    if engine.endswith(OPS_SUFFIX):
+        return cached_operations(engine[:-len(OPS_SUFFIX)], size, seed, cache)
+    return cached_measure(engine, size, seed, repeats, warmup,
+                          disable_gc, cache)
+
+
+def _pin_worker(cpus: List[int], counter) -> None:
+    '''Process pool initializer, pins every worker to its own CPU'''
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+
+
+def make_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    '''Process pool with one worker per available core (by default),
+    every worker pinned to its own CPU where the OS supports it'''
+    if not hasattr(os, 'sched_setaffinity'):
+        return ProcessPoolExecutor(workers or os.cpu_count())
+
+    cpus = sorted(os.sched_getaffinity(0))
+    return ProcessPoolExecutor(workers or len(cpus),
+                               initializer=_pin_worker,
+                               initargs=(cpus, multiprocessing.Value('i', 0)))
+
+
+def _submit(pool: Executor, tasks: List[Tuple[int, str]], seed: int,
+            repeats: int, warmup: int = 1, disable_gc: bool = True,
+            cache: Optional[MeasurementCache] = None) -> Dict:
+    '''Submits (size, engine) tasks missing from cache in given order'''
+    return {(size, engine): pool.submit(run_task, engine, size, seed,
+                                        repeats, warmup, disable_gc)
+            for size, engine in tasks
+            if cache is None or cache.get(cache_key(
+                engine, size, seed, repeats, warmup, disable_gc)) is None}
+
+
+def parallel_sweep(engines: List[str], sizes: Iterable[int], seed: int = 42,
+                   repeats: int = 5, warmup: int = 1, disable_gc: bool = True,
+                   workers: Optional[int] = None,
+                   cache: Optional[MeasurementCache] = None) -> List[Dict]:
+    '''Measures every (engine, size) in a pinned process pool,
+    results are ordered by engine, then by size'''
+    tasks = [(size, engine) for engine in engines for size in sizes]
+    # Snapshot of cached results, new results put into cache below
+    # may evict them before they are read
+    cached = {}
+    if cache is not None:
+        for size, engine in tasks:
+            result = cache.get(cache_key(engine, size, seed, repeats,
+                                         warmup, disable_gc))
+            if result is not None:
+                cached[size, engine] = result
+    with make_pool(workers) as pool:
+        # Largest sizes go first, so no worker is left with a long
+        # task at the end of the sweep
+        futures = _submit(pool, sorted(set(tasks) - set(cached),
+                                       reverse=True),
+                          seed, repeats, warmup, disable_gc)
+        results = []
+        for size, engine in tasks:
+            if (size, engine) in cached:
+                result = cached[size, engine]
+            else:
+                result = futures[size, engine].result()
+                if cache is not None:
+                    cache.put(cache_key(engine, size, seed, repeats, warmup,
+                                        disable_gc), result)
+            results.append({'engine': engine, 'size': size, **result})
+    return results
+
+
+def stream_benchmarks(engines: List[str], sizes: Iterable[int],
+                      cancel: threading.Event, points: queue.Queue,
+                      seed: int = 42, repeats: int = 3,
+                      cache: Optional[MeasurementCache] = None,
+                      pool: Optional[Executor] = None) -> None:
+    '''Measures engines size by size and puts (series, size, value)
+    into points: median time for every engine, then comparisons and
+    swaps of every counted engine, series 'comparisons (shake)' etc.
+    Sizes found in cache are not measured again,
+    the rest are measured in pool (if given). Stops as soon as
+    cancel is set'''
+    sizes = list(sizes)
+    counted = [ops_engine(engine) for engine in engines
+               if engine in COUNTED_ENGINES]
+    tasks = [(size, engine) for size in sizes
+             for engine in [*engines, *counted]]
+    futures = {}
+    if pool is not None:
+        futures = _submit(pool, tasks, seed, repeats, cache=cache)
+    try:
+        for size, engine in tasks:
+            if cancel.is_set():
+                return
+            if (size, engine) in futures:
+                future = futures[size, engine]
+                while not wait([future], timeout=0.1).done:
+                    if cancel.is_set():
+                        return
+                result = future.result()
+                if cache is not None:
+                    cache.put(cache_key(engine, size, seed, repeats), result)
+            else:
+                result = run_task(engine, size, seed, repeats, cache=cache)
+
+            if engine.endswith(OPS_SUFFIX):
+                engine = engine[:-len(OPS_SUFFIX)]
+                points.put((f'comparisons ({engine})', size,
+                            result['comparisons']))
+                points.put((f'swaps ({engine})', size, result['swaps']))
+            else:
+                points.put((engine, size, result['median']))
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+
+# Teoretical shaker sort time (ms) is TEOR_A * n(n - 1),
+# n(n - 1)/4 swaps on average
+TEOR_A = 1 / 4 / 1000
+
+
+def teor_time(size: int) -> float:
+    return TEOR_A * (size**2 - size)
+
+
+def fit_complexity(sizes: Iterable[int],
+                   times: Iterable[float]) -> Dict[str, float]:
+    '''Least squares fit of times to a*n**2 + b*n + c
+
+    Returns a, b, c, R^2 of the fit and ratio of a to the
+    teoretical quadratic constant'''
+    sizes = np.asarray(list(sizes), dtype=float)
+    times = np.asarray(list(times), dtype=float)
+    (a, b, c), *_ = np.linalg.lstsq(np.vander(sizes, 3), times, rcond=None)
+    ss_res = np.sum((times - (a * sizes**2 + b * sizes + c))**2)
+    ss_tot = np.sum((times - times.mean())**2)
+    return {'a': float(a), 'b': float(b), 'c': float(c),
+            'r2': float(1 - ss_res / ss_tot) if ss_tot else 1.,
+            'ratio': float(a / TEOR_A)}
+
+
+def detect_regressions(results: List[Dict], baseline: List[Dict],
+                       threshold: float = 0.1,
+                       min_time: float = 0.01) -> List[Dict]:
+    '''Compares medians of results with baseline results for the same
+    (engine, size) and returns those which differ by more than threshold
+    (relative). Baseline medians below min_time (ms) are too noisy
+    and are skipped'''
+    base = {(result.get('engine', 'shake'), int(result['size'])):
+            float(result['median']) for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result.get('engine', 'shake'), int(result['size']))
+        if key not in base or base[key] < min_time:
+            continue
+        change = float(result['median']) / base[key] - 1
+        if abs(change) > threshold:
+            regressions.append({'engine': key[0], 'size': key[1],
+                                'baseline': base[key],
+                                'median': float(result['median']),
+                                'change': change})
+    return regressions
+
+
+def load_results(path: str) -> List[Dict]:
+    '''Reads results written by export_results'''
+    with open(path, newline='') as file:
+        if path.endswith('.csv'):
+            return list(csv.DictReader(file))
+        return json.load(file)
+
+
+class LineBuffer:
+    '''Growing (x, y) arrays of a plotted line, points are appended
+    in place with amortized O(1) reallocation'''
+    def __init__(self, capacity: int = 256) -> None:
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.size = 0
+        self.max_y = 0.
+
+    def append(self, x: float, y: float) -> None:
+        if self.size == len(self.x):
+            self.x = np.resize(self.x, 2 * self.size)
+            self.y = np.resize(self.y, 2 * self.size)
+        self.x[self.size] = x
+        self.y[self.size] = y
+        self.size += 1
+        self.max_y = max(self.max_y, y)
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.x[:self.size], self.y[:self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def downsample(x: np.ndarray, y: np.ndarray,
+               width: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''Min/max decimation of a line to about 2 * width points,
+    keeps every peak visible at width pixels'''
+    per_pixel = len(x) // max(width, 1)
+    if per_pixel < 2:
+        return x, y
+    n = per_pixel * width
+    rows = y[:n].reshape(width, per_pixel)
+    starts = np.arange(0, n, per_pixel)
+    indices = np.sort(np.concatenate([starts + rows.argmin(axis=1),
+                                      starts + rows.argmax(axis=1)]))
+    indices = np.concatenate([indices, np.arange(n, len(x))])
+    return x[indices], y[indices]
+
+
+def export_results(results: List[Dict[str, float]], path: str) -> None:
+    '''Writes benchmark results to .csv or .json (by extension)'''
+    with open(path, 'w', newline='') as file:
+        if path.endswith('.csv'):
+            # Only counted engines have operation columns
+            fieldnames = list(dict.fromkeys(key for result in results
+                                            for key in result))
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump(results, file, indent=2)
+
+
+def stop_animation(animation: anim.Animation) -> None:
+    '''Stops animation for good: pause() clears animated flags of its
+    artists, private _stop() disconnects its resize and close handlers,
+    which would start it again (no public API does)'''
+    if animation.event_source is not None:
+        animation.pause()
+        animation._stop()
 
 
 class MyWindow:
-    def __init__(self, master):
+    def __init__(self, master, cache_path='lab2_cache.json', blit=True):
         self.master = master
+        self.blit = blit
         self.range = tk.Scale(from_=10, to=200, bg='white', width=15,
                               resolution=10, troughcolor='gray',
                               orient=tk.HORIZONTAL, command=self.show_plot,
@@ -23,77 +492,252 @@ class MyWindow:
         self.fig = Figure(figsize=(5, 4), dpi=100)
         self.canvas = FigureCanvasTkAgg(self.fig, self.master)
         self.ax = self.fig.add_subplot(111)
+        self.ax_ops = self.ax.twinx()
+        self.anim = None
+        self.cancel = threading.Event()
+        self.cache = MeasurementCache(path=cache_path)
+        self.pool = make_pool()
+        self.master.protocol('WM_DELETE_WINDOW', self.close)
         self.toolbar = NavigationToolbar2Tk(self.canvas, self.master)
 
+        self.engines_frame = tk.Frame(self.master, bg='white')
+        self.engines = {name: tk.BooleanVar(value=name == 'shake')
+                        for name in SORT_ENGINES}
+        for name, selected in self.engines.items():
+            tk.Checkbutton(self.engines_frame, text=name, variable=selected,
+                           bg='white').pack(side=tk.LEFT)
+
+        self.engines_frame.pack(side=tk.BOTTOM)
         self.range.pack(side=tk.BOTTOM)
         self.canvas.get_tk_widget().pack(
             side=tk.BOTTOM, fill=tk.BOTH, expand=True)
         self.toolbar.pack(side=tk.BOTTOM, fill=tk.Y)
 
-    def add_exec_time(f):
-        def timed(*args, **kw):
-            ts = time.time()
-            result = f(*args, **kw)
-            te = time.time()
-            exec_time = (te - ts) * 1000
-            return exec_time, result
-        return timed
-
-    @add_exec_time
-    def shake_sort(self, arr: list) -> list:
-        up = range(len(arr) - 1)
-        while True:
-            for indices in (up, reversed(up)):
-                swapped = False
-                for i in indices:
-                    if arr[i] > arr[i+1]:
-                        arr[i], arr[i+1] = arr[i+1], arr[i]
-                        swapped = True
-                if not swapped:
-                    return arr
-
     def show_plot(self, n_samples):
         n_samples = int(n_samples)
+        lens = list(range(n_samples))
+        engines = [name for name, selected in self.engines.items()
+                   if selected.get()] or ['shake']
 
-        # Creating unsorted arrays with different sizes
-        test_samples = [random.randint(low=1, high=20, size=size)
-                        for size in range(n_samples)]
+        # Cancel stale run and start measuring in background,
+        # points are drawn by animation as soon as they come
+        self.cancel.set()
+        if self.anim is not None:
+            stop_animation(self.anim)
+        self.cancel = threading.Event()
+        points: queue.Queue = queue.Queue()
+        worker = threading.Thread(
+            target=stream_benchmarks, daemon=True,
+            args=(engines, lens, self.cancel, points),
+            kwargs={'cache': self.cache, 'pool': self.pool})
+        worker.start()
 
-        # Get times of algorythm execution
-        times = [self.shake_sort(sample)[0] for sample in test_samples]
-        lens = [len(sample) for sample in test_samples]
-
-        teor_times = [(len(sample)**2 - len(sample)) / 4 / 1000
-                      for sample in test_samples]
+        teor_times = [teor_time(size) for size in lens]
 
         # Plot results of teoretical and testing times
         self.ax.clear()
-        line, = self.ax.plot(
-            0, 0, color='blue', linewidth=3, label='test')
+        self.ax_ops.clear()
+        lines = {engine: self.ax.plot([], [], linewidth=3,
+                                      label=f'test ({engine})')[0]
+                 for engine in engines}
+        ops_series = []
+        for engine in engines:
+            if engine not in COUNTED_ENGINES:
+                continue
+            color = lines[engine].get_color()
+            for series, linestyle in (('comparisons', ':'), ('swaps', '--')):
+                name = f'{series} ({engine})'
+                lines[name], = self.ax_ops.plot(
+                    [], [], linestyle=linestyle, color=color, label=name)
+                ops_series.append(name)
+        self.ax_ops.set_ylabel('operations')
+        if ops_series:
+            self.ax_ops.legend(loc='lower right')
         self.ax.plot(lens, teor_times, linestyle='-.',
                      color='green', linewidth=3, label='teoretical')
 
-        self.ax.set_xlim(0, lens[-1])
-        self.ax.set_ylim(0, times[-1])
+        self.ax.set_xlim(0, max(lens[-1], 1))
         self.ax.set(title='Testing Shaker sorting algorythm',
                     xlabel='length of array', ylabel='sorting time ms')
         self.ax.legend()
 
-        def animate(i):
-            line.set_data(lens[:i], times[:i])
-            return line,
+        data = {series: LineBuffer() for series in lines}
+        self.ax.set_ylim(0, 1)
+        self.ax_ops.set_ylim(0, 1)
+
+        finished = False
+
+        def frames():
+            # Ends one frame after the sweep is drawn, so the animation
+            # stops and disconnects its handlers by itself. Every new
+            # sequence has a frame, even if the sweep is already drawn
+            while True:
+                yield
+                if finished:
+                    return
+
+        def animate(_):
+            nonlocal finished
+            changed = set()
+            while True:
+                try:
+                    series, size, value = points.get_nowait()
+                except queue.Empty:
+                    break
+                data[series].append(size, value)
+                changed.add(series)
+
+            width = int(self.ax.get_window_extent().width)
+            for series in changed:
+                lines[series].set_data(downsample(*data[series].view(),
+                                                  width))
+
+            # Limits grow geometrically, so in blit mode the whole
+            # figure is redrawn only a few times per sweep. Both axes
+            # share one bbox and each keeps its own blit background,
+            # so they are rescaled together: a view change of both
+            # makes FuncAnimation cache both backgrounds again
+            tops = [(ax, max((data[name].max_y for name in series),
+                             default=0))
+                    for ax, series in ((self.ax, engines),
+                                       (self.ax_ops, ops_series))]
+            if any(top > ax.get_ylim()[1] for ax, top in tops):
+                for ax, top in tops:
+                    if self.blit:
+                        ax.set_ylim(0, max(top, ax.get_ylim()[1]) * 1.5)
+                    elif top > ax.get_ylim()[1]:
+                        ax.set_ylim(0, top)
+                if self.blit:
+                    self.canvas.draw()
+
+            if not worker.is_alive() and points.empty():
+                finished = True
+                for engine in engines:
+                    if len(data[engine]) < 3:
+                        continue
+                    fit = fit_complexity(*data[engine].view())
+                    lines[engine].set_label(
+                        f'test ({engine}): {fit["ratio"]:.2f} teor, '
+                        f'R²={fit["r2"]:.2f}')
+                self.ax.legend()
+                # Full redraw skips animated artists. Nothing is returned,
+                # so FuncAnimation does not mark them again and redraws
+                # the whole figure
+                for line in lines.values():
+                    line.set_animated(False)
+                return ()
+            return tuple(lines.values())
 
         self.anim = anim.FuncAnimation(
-            self.fig, animate, lens, interval=70, blit=False)
+            self.fig, animate, frames=frames, interval=1000 // 60,
+            blit=self.blit, repeat=False, cache_frame_data=False)
 
         self.canvas.draw()
         self.toolbar.update()
 
+    def close(self):
+        self.cancel.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.cache.save()
+        finally:
+            self.master.destroy()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Shaker sort benchmark')
+    parser.add_argument('--headless', action='store_true',
+                        help='run benchmark without GUI')
+    parser.add_argument('--engines', nargs='+', default=['shake'],
+                        choices=list(SORT_ENGINES))
+    parser.add_argument('--sizes', type=int, nargs=3, default=[0, 200, 10],
+                        metavar=('START', 'STOP', 'STEP'))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep-gc', action='store_true',
+                        help='do not disable GC while timing')
+    parser.add_argument('--count', action='store_true',
+                        help='add operation counts to results of counted engines')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='pinned worker processes, 0 for one per core')
+    parser.add_argument('--cache', help='.json file to reuse measurements '
+                        '(ignored with --baseline)')
+    parser.add_argument('--fit', action='store_true',
+                        help='fit a*n^2 + b*n + c to median times')
+    parser.add_argument('--baseline',
+                        help='results to check for regressions against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as regression')
+    parser.add_argument('--out', help='.json or .csv file for results')
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.headless:
+        # Regression check needs fresh timings, not cached ones
+        cache = (MeasurementCache(path=args.cache)
+                 if args.cache and not args.baseline else None)
+        engines = args.engines + [ops_engine(engine)
+                                  for engine in args.engines * args.count
+                                  if engine in COUNTED_ENGINES]
+        sizes = range(*args.sizes)
+        if args.workers == 1:
+            results = [{'engine': engine, 'size': size,
+                        **run_task(engine, size, args.seed, args.repeats,
+                                   args.warmup, not args.keep_gc, cache)}
+                       for engine in engines for size in sizes]
+        else:
+            results = parallel_sweep(engines, sizes, args.seed, args.repeats,
+                                     args.warmup, not args.keep_gc,
+                                     args.workers or None, cache)
+        if args.count:
+            # Counts are attached only to rows of the engine
+            # they were counted for
+            ops = {(result['engine'], result['size']): result
+                   for result in results
+                   if result['engine'].endswith(OPS_SUFFIX)}
+            rows = []
+            for result in results:
+                if result['engine'].endswith(OPS_SUFFIX):
+                    continue
+                counts = ops.get((ops_engine(result['engine']),
+                                  result['size']), {})
+                rows.append({**result,
+                             **{key: counts[key] for key in
+                                ('comparisons', 'swaps', 'passes')
+                                if key in counts}})
+            results = rows
+        if cache is not None:
+            cache.save()
+        if args.out:
+            export_results(results, args.out)
+        else:
+            print(json.dumps(results, indent=2))
+
+        if args.fit:
+            for engine in args.engines:
+                engine_results = [result for result in results
+                                  if result['engine'] == engine]
+                fit = fit_complexity(
+                    [result['size'] for result in engine_results],
+                    [result['median'] for result in engine_results])
+                print(f'{engine}: ' + ', '.join(
+                    f'{key}={value:.4g}' for key, value in fit.items()))
+
+        regressions = []
+        if args.baseline:
+            regressions = detect_regressions(
+                results, load_results(args.baseline), args.threshold)
+            for regression in regressions:
+                print('{engine} n={size}: {baseline:.4g} -> {median:.4g} ms '
+                      '({change:+.0%})'.format(**regression))
+        raise SystemExit(1 if regressions else 0)
+
     root = tk.Tk()
     root.configure(background='white')
-    root.geometry('420x500')
+    root.geometry('420x530')
     root.title('LAB 2')
     app = MyWindow(root)
     root.mainloop()
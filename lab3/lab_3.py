@@ -4,11 +4,329 @@ from tkinter import messagebox
 import tkinter as tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
-import parser
+from functools import partial, lru_cache
+from typing import Callable, NamedTuple
+import ast
 
 matplotlib.use('TkAgg')
 
 
+# Whitelist of names formulas may use, with or without `np.` prefix
+UFUNCS = {name: getattr(np, name) for name in (
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh',
+    'tanh', 'arcsinh', 'arccosh', 'arctanh', 'exp', 'expm1', 'log', 'log1p',
+    'log2', 'log10', 'sqrt', 'cbrt', 'abs', 'sign', 'floor', 'ceil',
+    'power', 'arctan2', 'hypot', 'minimum', 'maximum')}
+CONSTANTS = {'e': np.e, 'pi': np.pi}
+BINOPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+          ast.Div: np.true_divide, ast.Pow: np.power, ast.Mod: np.mod}
+UNARYOPS = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+
+def _lookup(node: ast.AST, table: dict):
+    ''' Resolves `name` or `np.name` node in table, None if not there '''
+    if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+            and node.value.id in ('np', 'numpy')):
+        return table.get(node.attr)
+    if isinstance(node, ast.Name):
+        return table.get(node.id)
+    return None
+
+
+def _build(node: ast.AST) -> Callable:
+    ''' Turns whitelisted AST node into a function of x '''
+    if isinstance(node, ast.Expression):
+        return _build(node.body)
+    if (isinstance(node, ast.Constant) and not isinstance(node.value, bool)
+            and isinstance(node.value, (int, float))):
+        value = float(node.value)
+        return lambda x: value
+    if isinstance(node, ast.Name) and node.id == 'x':
+        return lambda x: x
+    constant = _lookup(node, CONSTANTS)
+    if constant is not None:
+        return lambda x: constant
+    if isinstance(node, ast.BinOp) and type(node.op) in BINOPS:
+        op = BINOPS[type(node.op)]
+        left, right = _build(node.left), _build(node.right)
+        return lambda x: op(left(x), right(x))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARYOPS:
+        op = UNARYOPS[type(node.op)]
+        operand = _build(node.operand)
+        return lambda x: op(operand(x))
+    if isinstance(node, ast.Call) and not node.keywords:
+        func = _lookup(node.func, UFUNCS)
+        if func is not None:
+            args = [_build(arg) for arg in node.args]
+            return lambda x: func(*(arg(x) for arg in args))
+    raise ValueError(f'Unsupported expression: {ast.unparse(node)}')
+
+
+@lru_cache(maxsize=128)
+def _compile_normalized(expr: str) -> Callable[[np.array], np.array]:
+    func = _build(ast.parse(expr, mode='eval'))
+
+    def compiled(x: np.array) -> np.array:
+        x = np.asarray(x, dtype=float)
+        return np.broadcast_to(func(x), x.shape).astype(float)
+    return compiled
+
+
+def compile_expression(expr: str) -> Callable[[np.array], np.array]:
+    '''
+    Compiles formula of x into a vectorized function
+
+    Only numbers, x, arithmetic and whitelisted NumPy ufuncs and
+    constants (see UFUNCS, CONSTANTS) are allowed, nothing is eval'ed.
+    Compiled functions are cached by formula without whitespace
+
+    expr: str
+        formula like 'np.e ** -(x + np.sin(x))'
+    return: Callable
+        f(x) for np.array x
+    '''
+    return _compile_normalized(''.join(expr.split()))
+
+
+def newton_horner(nodes: np.array, coeffs: np.array, t: np.array) -> np.array:
+    '''
+    Evaluates Newton's polynomial in nested (Horner) form
+    c0 + (t - x0)(c1 + (t - x1)(c2 + ...)) in O(n * m)
+
+    nodes: np.array
+        interpolation nodes x0..x(n-1)
+    coeffs: np.array
+        NDD coeffs for the nodes, shape (n,) or (k, n)
+        for k polynomials on the same nodes
+    t: np.array
+        m points to evaluate at
+    return: np.array
+        polynomial values at t, shape of t or (k, *t.shape)
+    '''
+    t = np.asarray(t, dtype=float)
+    # Nodes go first, coeffs of one node broadcast against t
+    coeffs = np.moveaxis(np.asarray(coeffs, dtype=float), -1, 0)
+    batch = coeffs.shape[1:]
+    coeffs = coeffs.reshape(coeffs.shape + (1,) * t.ndim)
+    result = np.empty(batch + t.shape)
+    result[...] = coeffs[-1]
+    for k in range(len(nodes) - 2, -1, -1):
+        result *= t - nodes[k]
+        result += coeffs[k]
+    return result
+
+
+def ndd_coeffs(x: np.array, y: np.array) -> np.array:
+    '''
+    Computes NDD (Newton's Divided Difference) coeffs
+
+    Pyramid is built column by column in one array:
+    after step j, coeffs[..., i] holds f[x_(i-j), ..., x_i] for i >= j
+
+    x: np.array
+        n interpolation nodes
+    y: np.array
+        function values at nodes, shape (n,) or (k, n)
+        for k functions, node differences are shared by all of them
+    return: np.array
+        coeffs of the same shape as y
+    '''
+    coeffs = np.array(y, dtype=float)
+    for j in range(1, coeffs.shape[-1]):
+        coeffs[..., j:] = ((coeffs[..., j:] - coeffs[..., j-1:-1]) /
+                           (x[j:] - x[:-j]))
+    return coeffs
+
+
+def interpolate_batch(x: np.array, Y: np.array, t: np.array) -> np.array:
+    '''
+    Newton's interpolation of k functions sharing nodes x
+
+    x: np.array
+        n interpolation nodes
+    Y: np.array
+        function values, shape (k, n)
+    t: np.array
+        shared grid of m points
+    return: np.array
+        values of all interpolants on t, shape (k, m)
+    '''
+    return newton_horner(x, ndd_coeffs(x, Y), t)
+
+
+def chebyshev_nodes(a: float, b: float, n: int) -> np.array:
+    ''' n Chebyshev points of the second kind on [a, b], ascending '''
+    if n == 1:
+        return np.array([(a + b) / 2])
+    return (a + b) / 2 - (b - a) / 2 * np.cos(np.pi * np.arange(n) / (n - 1))
+
+
+def chebyshev_weights(n: int) -> np.array:
+    ''' Barycentric weights of chebyshev_nodes in O(n):
+        (-1)^j, halved at both ends '''
+    weights = (-1.) ** np.arange(n)
+    if n > 1:
+        weights[[0, -1]] /= 2
+    return weights
+
+
+def barycentric_eval(nodes: np.array, y: np.array, weights: np.array,
+                     t: np.array, chunk_elems: int = 1 << 22) -> np.array:
+    '''
+    Evaluates interpolant with the second barycentric formula
+    p(t) = sum(w_j * y_j / (t - x_j)) / sum(w_j / (t - x_j)),
+    O(n) per point, points are processed by chunks of
+    about chunk_elems / n to bound memory
+
+    nodes: np.array
+        interpolation nodes
+    y: np.array
+        function values at nodes
+    weights: np.array
+        barycentric weights of nodes
+    t: np.array
+        points to evaluate at
+    return: np.array
+        interpolant values at t
+    '''
+    t = np.asarray(t, dtype=float)
+    flat = t.ravel()
+    result = np.empty_like(flat)
+    step = max(1, chunk_elems // len(nodes))
+    for start in range(0, flat.size, step):
+        diff = flat[start:start+step, None] - nodes
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kernel = weights / diff
+            values = (kernel @ y) / kernel.sum(axis=1)
+        # Points which hit a node exactly take its value
+        rows, cols = np.nonzero(diff == 0)
+        values[rows] = y[cols]
+        result[start:start+step] = values
+    return result.reshape(t.shape)
+
+
+class ErrorReport(NamedTuple):
+    ''' Interpolation error R(x) = f(x) - P(x) on a dense grid '''
+    max_abs: float
+    rms: float
+    argmax: float
+    # Signed R at argmax
+    err_at_max: float
+    # Downsampled curve: bin centers with min and max of R in every bin
+    x: np.array
+    err_min: np.array
+    err_max: np.array
+
+
+def error_analysis(func: Callable, interpolant: Callable, a: float, b: float,
+                   n_points: int = 10 ** 7, chunk: int = 1 << 20,
+                   n_bins: int = 1000) -> ErrorReport:
+    '''
+    Samples f and its interpolant on n_points of [a, b] by chunks,
+    so memory does not depend on n_points
+
+    func: Callable
+        vectorized f(x)
+    interpolant: Callable
+        vectorized P(x)
+    n_bins: int
+        points of downsampled error curve
+    return: ErrorReport
+        max |R|, RMS of R, x of max |R| and R there, downsampled R;
+        points where R is NaN (f or P undefined) are skipped
+    '''
+    n_bins = min(n_bins, n_points)
+    err_min = np.full(n_bins, np.inf)
+    err_max = np.full(n_bins, -np.inf)
+    max_abs, argmax, err_at_max = -1., a, 0.
+    sum_sq, n_valid = 0., 0
+
+    for start in range(0, n_points, chunk):
+        idx = np.arange(start, min(start + chunk, n_points))
+        x = a + (b - a) * idx / max(n_points - 1, 1)
+        err = func(x) - interpolant(x)
+
+        valid = ~np.isnan(err)
+        if not valid.any():
+            continue
+        i = np.nanargmax(np.abs(err))
+        if abs(err[i]) > max_abs:
+            max_abs, argmax = float(abs(err[i])), float(x[i])
+            err_at_max = float(err[i])
+        sum_sq += float(np.dot(err[valid], err[valid]))
+        n_valid += int(valid.sum())
+
+        # Bins are contiguous runs of idx, reduce every run at once
+        bins = idx * n_bins // n_points
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        np.minimum.at(err_min, bins[starts], np.fmin.reduceat(err, starts))
+        np.maximum.at(err_max, bins[starts], np.fmax.reduceat(err, starts))
+
+    # Bins without valid points are left as gaps
+    empty = err_min > err_max
+    err_min[empty] = err_max[empty] = np.nan
+
+    x = a + (b - a) * (np.arange(n_bins) + 0.5) / n_bins
+    rms = float(np.sqrt(sum_sq / n_valid)) if n_valid else np.nan
+    return ErrorReport(max_abs, rms, argmax, err_at_max, x, err_min, err_max)
+
+
+class NewtonInterpolator():
+    '''
+    Newton's interpolation fed with control points one by one
+
+    Keeps the last diagonal of NDD pyramid,
+    diagonal[k] = f[x_(n-1-k), ..., x_(n-1)], so appending
+    a point costs O(n) and only adds one coeff to Newton's form
+    '''
+    def __init__(self, capacity: int = 16) -> None:
+        self._nodes = np.empty(capacity)
+        self._coeffs = np.empty(capacity)
+        self._diagonal = np.empty(capacity)
+        self.n = 0
+
+    def append(self, x: float, y: float) -> None:
+        n = self.n
+        if n == len(self._nodes):
+            self._nodes = np.resize(self._nodes, 2 * n)
+            self._coeffs = np.resize(self._coeffs, 2 * n)
+            self._diagonal = np.resize(self._diagonal, 2 * n)
+        if np.any(self._nodes[:n] == x):
+            raise ValueError(f'x = {x} is already a control point')
+
+        # New diagonal: d'[0] = y, d'[k] = (d'[k-1] - d[k-1]) / (x - x_(n-k))
+        prev, diagonal = float(y), self._diagonal
+        for k in range(1, n + 1):
+            diagonal[k-1], prev = prev, ((prev - diagonal[k-1]) /
+                                         (x - self._nodes[n-k]))
+        diagonal[n] = prev
+
+        self._nodes[n] = x
+        self._coeffs[n] = prev
+        self.n += 1
+
+    def extend(self, x: np.array, y: np.array) -> None:
+        for x_i, y_i in zip(x, y):
+            self.append(x_i, y_i)
+
+    @property
+    def nodes(self) -> np.array:
+        return self._nodes[:self.n]
+
+    @property
+    def coeffs(self) -> np.array:
+        return self._coeffs[:self.n]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __call__(self, t: np.array) -> np.array:
+        ''' Evaluates current Newton's polynomial at t '''
+        if not self.n:
+            raise ValueError('No control points yet')
+        return newton_horner(self.nodes, self.coeffs, t)
+
+
 class Lab():
     def __init__(self, master: tk.Tk) -> None:
         # Initialize GUI vars and consts
@@ -20,6 +338,8 @@ class Lab():
         self.b_plholder = '5'
         self.n_plholder = '10'
         self.f_plholder = 'np.e ** -(x + np.sin(x))'
+        # Grid size of error analysis
+        self.err_points = 10 ** 6
 
         self.lbl_a = tk.Label(self.frame, text='Enter a:')
         self.lbl_b = tk.Label(self.frame, text='Enter b:')
@@ -39,6 +359,13 @@ class Lab():
         self.entry_f = tk.Entry(self.frame, width=20)
         self.entry_f.insert(0, self.f_plholder)
 
+        self.engine = tk.StringVar(value='Newton')
+        self.radio_newton = tk.Radiobutton(
+            self.frame, text='Newton', variable=self.engine, value='Newton')
+        self.radio_chebyshev = tk.Radiobutton(
+            self.frame, text='Chebyshev', variable=self.engine,
+            value='Chebyshev')
+
         self.lbl_a.grid(row=0, column=0)
         self.entry_a.grid(row=0, column=1)
         self.lbl_b.grid(row=1, column=0)
@@ -47,20 +374,13 @@ class Lab():
         self.entry_n.grid(row=2, column=1)
         self.lbl_f.grid(row=3, column=0, columnspan=2)
         self.entry_f.grid(row=4, column=0, columnspan=3)
-        self.btn_interpolate.grid(row=5, column=0, columnspan=3)
+        self.radio_newton.grid(row=5, column=0)
+        self.radio_chebyshev.grid(row=5, column=1, columnspan=2)
+        self.btn_interpolate.grid(row=6, column=0, columnspan=3)
 
     def _getNDDCoeffs(self, x: np.array, y: np.array) -> np.array:
-        ''' Creates NDD (Newton's Divided Difference) pyramid
-            and extracts coeffs '''
-        n = y.shape[0]
-        pyramid = np.zeros([n, n])  # Create a square matrix to hold pyramid
-        pyramid[::, 0] = y  # first column is y
-        for j in range(1, n):
-            for i in range(n - j):
-                # create pyramid by updating other columns
-                pyramid[i][j] = ((pyramid[i+1][j-1] - pyramid[i][j-1]) /
-                                 (x[i+j] - x[i]))
-        return pyramid[0]  # return first row
+        ''' Computes NDD (Newton's Divided Difference) coeffs '''
+        return ndd_coeffs(x, y)
 
     def interpolate(self, x: np.array, y: np.array, n: int) -> np.array:
         '''
@@ -75,21 +395,25 @@ class Lab():
         return: np.array
             interpolation result
         '''
-        coeffs = self._getNDDCoeffs(x, y)
-        final_pol = np.polynomial.Polynomial([0.])  # our target polynomial
-        for i in range(n):
-            p = np.polynomial.Polynomial([1.])  # create a dummy polynomial
-            for j in range(i):
-                # each vector has degree of i
-                # their terms are dependant on 'x' values
-                p_temp = np.polynomial.Polynomial([-x[j], 1.])  # (x - x_j)
-                p = np.polymul(p, p_temp)  # multiply dummy with expression
-            p *= coeffs[i]  # apply coefficient
-            final_pol = np.polyadd(final_pol, p)  # add to target polynomial
-
-        p = np.flip(final_pol[0].coef, axis=0)
-        y_intp = np.polyval(p, x)
-        return y_intp
+        coeffs = self._getNDDCoeffs(x[:n], y[:n])
+        return newton_horner(x[:n], coeffs, x)
+
+    def interpolate_barycentric(self, x: np.array, y: np.array,
+                                n: int) -> np.array:
+        '''
+        Barycentric interpolation, stable for thousands of nodes
+
+        x: np.array
+            range of interpolation, first n points are
+            Chebyshev nodes (see chebyshev_nodes)
+        y: np.array
+            function values on range of interpolation
+        n: int
+            number of control points
+        return: np.array
+            interpolation result
+        '''
+        return barycentric_eval(x[:n], y[:n], chebyshev_weights(n), x)
 
     def plot_interpolation(self) -> None:
         try:
@@ -101,14 +425,23 @@ class Lab():
                 messagebox.showerror('a >= b !')
                 raise ValueError('a >= b !')
 
-            x = np.linspace(self.a, self.b, self.n)
-
-            self.expr = parser.expr(self.entry_f.get().replace(' ', ''))
-            compiled = self.expr.compile()
-
-            self.y_true = eval(compiled)
-            self.y_intp = self.interpolate(x, self.y_true, self.n)
-            self.err = self.compute_err(self.y_true, self.y_intp)
+            if self.engine.get() == 'Chebyshev':
+                x = chebyshev_nodes(self.a, self.b, self.n)
+            else:
+                x = np.linspace(self.a, self.b, self.n)
+
+            self.func = compile_expression(self.entry_f.get())
+            self.y_true = self.func(x)
+            self.x_nodes = x
+            if self.engine.get() == 'Chebyshev':
+                self.interpolant = partial(barycentric_eval, x, self.y_true,
+                                           chebyshev_weights(self.n))
+            else:
+                self.interpolant = partial(
+                    newton_horner, x, self._getNDDCoeffs(x, self.y_true))
+            self.y_intp = self.interpolant(x)
+            self.report = error_analysis(self.func, self.interpolant,
+                                         self.a, self.b, self.err_points)
             self.show_plots()
 
         except Exception:
@@ -121,9 +454,6 @@ class Lab():
             self.entry_n.insert(0, self.n_plholder)
             self.entry_f.insert(0, self.f_plholder)
 
-    def compute_err(self, y_true: np.array, y_intp: np.array) -> np.array:
-        return y_true - y_intp
-
     def show_plots(self) -> None:
         plot_window = tk.Toplevel(self.frame)
         plot_window.title('Graphics')
@@ -133,18 +463,22 @@ class Lab():
 
         f1 = fig.add_subplot(211)
         f1.set_ylabel('f(x)')
-        f1.set_title('Newton\'s interpolation')
+        f1.set_title('Newton\'s interpolation'
+                     if self.engine.get() == 'Newton' else
+                     'Barycentric interpolation')
 
         x = np.linspace(self.a - 1, self.b + 1, self.n * 100)
-
-        compiled = self.expr.compile()
-        y_true = eval(compiled)
+        y_true = self.func(x)
 
         f1.plot(x, y_true, label='y(x)=' +
                 self.entry_f.get().replace(' ', '').replace('np.', ''),
                 linewidth=2)
 
-        x = np.linspace(self.a, self.b, self.n)
+        x = x[(x >= self.a) & (x <= self.b)]
+        f1.plot(x, self.interpolant(x),
+                label='P(x)', linewidth=1)
+
+        x = self.x_nodes
         f1.plot(x, self.y_intp, 'o', label='interpolation',
                 linewidth=4)
         f1.legend(loc=3, prop={'size': 7})
@@ -152,9 +486,13 @@ class Lab():
         f2 = fig.add_subplot(212)
         f2.set_xlabel('x')
         f2.set_ylabel('R(x)')
-        f2.set_title('Divergence')
+        f2.set_title(f'Divergence: max|R|={self.report.max_abs:.2e} '
+                     f'at x={self.report.argmax:.3f}, '
+                     f'RMS={self.report.rms:.2e}', fontsize=7)
 
-        f2.plot(x, self.err)
+        f2.fill_between(self.report.x, self.report.err_min,
+                        self.report.err_max)
+        f2.plot(self.report.argmax, self.report.err_at_max, 'x', color='red')
         fig.subplots_adjust(hspace=0.4)
 
         canvas.get_tk_widget().pack(
@@ -165,6 +503,6 @@ class Lab():
 if __name__ == '__main__':
     root = tk.Tk()
     root.title('LAB 3')
-    root.geometry('200x150')
+    root.geometry('200x180')
     app = Lab(root)
     root.mainloop()
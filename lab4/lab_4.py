@@ -6,12 +6,450 @@ import tkinter as tk
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,
                                                NavigationToolbar2Tk)
 from matplotlib.figure import Figure
-from typing import Tuple, List, Optional
-from functools import partial
+from typing import Tuple, List, Optional, Callable, NamedTuple
+from functools import partial, lru_cache
 
 matplotlib.use('TkAgg')
 
 
+@lru_cache(maxsize=128)
+def compile_numeric(expr: sp.Expr) -> Callable[[np.ndarray], np.ndarray]:
+    '''Lambdify expression of x into NumPy function, cached by expression
+
+    Arguments:
+        expr {sp.Expr} -- sympy expression of x
+
+    Returns:
+        Callable -- f(x) for floats and np.ndarray, inf or nan where
+                    f is undefined
+    '''
+    func = sp.lambdify(sp.Symbol('x'), expr, 'numpy')
+
+    def compiled(x):
+        # Python floats would raise ZeroDivisionError, NumPy gives inf
+        x = np.asarray(x, dtype=float)
+        with np.errstate(all='ignore'):
+            y = func(x)
+        # Constant expressions give scalar, broadcast it to x
+        return np.broadcast_to(y, x.shape) * 1.
+
+    return compiled
+
+
+class PolynomialRoots(NamedTuple):
+    ''' Isolated real roots of polynomial, independent of precision '''
+    poly: sp.Poly
+    # Companion matrix eigenvalues (np.roots)
+    eigenvalues: np.ndarray
+    intervals: List[Tuple[float, float]]
+    # Starting point of Neuton's method in every interval
+    guesses: List[float]
+
+
+class ParsedEquation(NamedTuple):
+    ''' Simplified equation, its derivatives and their numeric forms '''
+    expr: sp.Expr
+    dy_dx_1: sp.Expr
+    dy_dx_2: sp.Expr
+    f: Callable
+    df: Callable
+    d2f: Callable
+    # Isolated roots if equation is polynomial with rational coefficients
+    roots: Optional[PolynomialRoots]
+
+
+@lru_cache(maxsize=32)
+def parse_equation(equ_str: str) -> ParsedEquation:
+    '''Simplify and differentiate equation, cached by normalized string
+
+    Arguments:
+        equ_str {str} -- left side of equation "... = 0", no spaces
+
+    Returns:
+        ParsedEquation -- expression, derivatives, compiled functions
+                          and isolated roots of polynomial
+    '''
+    x = sp.Symbol('x')
+    expr = sp.simplify(equ_str)
+    dy_dx_1 = expr.diff()
+    dy_dx_2 = dy_dx_1.diff()
+    roots = None
+    if expr.free_symbols <= {x} and expr.is_polynomial(x):
+        roots = isolate_polynomial(expr, x)
+    return ParsedEquation(expr, dy_dx_1, dy_dx_2,
+                          compile_numeric(expr), compile_numeric(dy_dx_1),
+                          compile_numeric(dy_dx_2), roots)
+
+
+def _zero_brackets(x: np.ndarray, y: np.ndarray,
+                   edges: bool = True) -> List[Tuple[float, float]]:
+    '''Intervals for samples where f(x) == 0, row by row
+
+    A lone zero sample is an exact root (x, x). Runs of zeros come
+    from underflow (e.g. exp(x) far left) or from flat f, a run is
+    collapsed to one interval around it, kept only if f changes
+    sign across it. Zeros at the ends of refined rows were already
+    checked one level up, so they are skipped unless edges is set.
+    '''
+    zero = np.pad(y == 0, ((0, 0), (1, 1)))
+    starts = zero[:, 1:-1] & ~zero[:, :-2]
+    ends = zero[:, 1:-1] & ~zero[:, 2:]
+    rows, first = np.nonzero(starts)
+    last = np.nonzero(ends)[1]
+
+    if not edges:
+        inner = (first > 0) & (last < y.shape[1] - 1)
+        rows, first, last = rows[inner], first[inner], last[inner]
+
+    lone = first == last
+    brackets = list(zip(x[rows[lone], first[lone]],
+                        x[rows[lone], first[lone]]))
+
+    rows, left, right = rows[~lone], first[~lone] - 1, last[~lone] + 1
+    inside = (left >= 0) & (right < y.shape[1])
+    rows, left, right = rows[inside], left[inside], right[inside]
+    crossing = y[rows, left] * y[rows, right] < 0
+    brackets += zip(x[rows[crossing], left[crossing]],
+                    x[rows[crossing], right[crossing]])
+    return brackets
+
+
+def bracket_roots(f: Callable, df: Callable,
+                  a: float = -1000., b: float = 1000., step: float = 0.1,
+                  refine: int = 10, max_depth: int = 6,
+                  max_samples: int = 10 ** 7) -> List[Tuple[float, float]]:
+    '''Find intervals with roots of f on [a, b]
+
+    f is sampled on the whole range in one call, sign changes are
+    found with array ops. Intervals where f' changes sign (extremum
+    inside, so there may be a pair of close roots, a double root or
+    several roots) are split into refine parts, all of them at once,
+    up to max_depth times or until a level needs more than
+    max_samples samples.
+
+    Arguments:
+        f {Callable} -- vectorized f(x)
+        df {Callable} -- vectorized f'(x)
+
+    Keyword Arguments:
+        a {float} -- left end of search range (default: {-1000.})
+        b {float} -- right end of search range (default: {1000.})
+        step {float} -- sampling step (default: {0.1})
+        refine {int} -- parts of every refined interval (default: {10})
+        max_depth {int} -- refinement levels (default: {6})
+        max_samples {int} -- samples per level (default: {10 ** 7})
+
+    Returns:
+        List[Tuple[float, float]] -- sorted intervals, (x, x) for
+                                     lone samples where f(x) == 0
+    '''
+    intervals: List[Tuple[float, float]] = []
+    x = np.linspace(a, b, int(np.ceil((b - a) / step)) + 1)[None, :]
+
+    with np.errstate(all='ignore'):
+        for depth in range(max_depth + 1):
+            y, dy = f(x), df(x)
+            intervals += _zero_brackets(x, y, edges=depth == 0)
+
+            # Neighbour samples form intervals, rows never mix
+            lo, hi = x[:, :-1].ravel(), x[:, 1:].ravel()
+            y_lo, y_hi = y[:, :-1].ravel(), y[:, 1:].ravel()
+            dy_lo, dy_hi = dy[:, :-1].ravel(), dy[:, 1:].ravel()
+            extremum = (dy_lo * dy_hi < 0) | ((dy_lo == 0) ^ (dy_hi == 0))
+            sign_change = y_lo * y_hi < 0
+
+            n_refined = np.count_nonzero(extremum) * (refine + 1)
+            stop = (depth == max_depth or not n_refined or
+                    n_refined > max_samples)
+            if stop:
+                # Double root: f touches zero at the extremum,
+                # |f| is about w * |f'(hi) - f'(lo)| or less
+                width = hi - lo
+                touch = (extremum & (y_lo * y_hi > 0) &
+                         (np.minimum(abs(y_lo), abs(y_hi)) <=
+                          width * abs(dy_hi - dy_lo)))
+                found = sign_change | touch
+            else:
+                found = sign_change & ~extremum
+            intervals += list(zip(lo[found], hi[found]))
+
+            if stop:
+                break
+            x = (lo[extremum, None] +
+                 (hi - lo)[extremum, None] * np.linspace(0, 1, refine + 1))
+
+    return sorted({(float(lo), float(hi)) for lo, hi in intervals})
+
+
+def newton_solve(f: Callable, df: Callable, d2f: Callable,
+                 intervals: List[Tuple[float, float]], eps: float,
+                 max_iter: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+    '''Neuton's method on all intervals at once
+
+    Every interval is a lane of NumPy arrays, lanes which converged
+    or left [a - 3, b + 3] are dropped from the next steps, so
+    solving stops when no lane is left.
+
+    Arguments:
+        f {Callable} -- vectorized f(x)
+        df {Callable} -- vectorized f'(x)
+        d2f {Callable} -- vectorized f''(x)
+        intervals {List[Tuple[float, float]]} -- search areas
+        eps {float} -- precision
+
+    Keyword Arguments:
+        max_iter {int} -- iterations limit (default: {1000})
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- roots (nan if not found) and
+                                         iterations for every interval
+    '''
+    a, b = np.array(intervals, dtype=float).reshape(-1, 2).T
+    roots = np.full(a.size, np.nan)
+    iterations = np.zeros(a.size, dtype=int)
+
+    with np.errstate(all='ignore'):
+        x = np.where(f(a) * d2f(a) >= 0, a, b)
+        active = np.arange(a.size)
+        for i in range(1, max_iter + 1):
+            if not active.size:
+                break
+            prev_x = x[active]
+            f_x = f(prev_x)
+            x_new = np.where(f_x == 0, prev_x, prev_x - f_x / df(prev_x))
+            iterations[active] = i
+
+            diverged = (~np.isfinite(x_new) |
+                        (x_new + 3 < a[active]) | (x_new - 3 > b[active]))
+            converged = ~diverged & (abs(x_new - prev_x) <= eps)
+            roots[active[converged]] = x_new[converged]
+
+            x[active] = x_new
+            active = active[~(converged | diverged)]
+
+    return roots, iterations
+
+
+def safeguarded_newton(f: Callable, df: Callable, a: float, b: float,
+                       eps: float) -> Tuple[Optional[float], int, int]:
+    '''Neuton's method safeguarded by bisection (rtsafe)
+
+    Keeps the bracket [a, b] with f(a) * f(b) <= 0. Newton step is
+    taken only if it stays inside the bracket and shrinks the step at
+    least twice compared with the one before the last, otherwise the
+    bracket is bisected. So it converges within about
+    2 * log2((b - a) / eps) steps.
+
+    Arguments:
+        f {Callable} -- f(x)
+        df {Callable} -- f'(x)
+        a {float} -- left end of interval
+        b {float} -- right end of interval
+        eps {float} -- precision
+
+    Returns:
+        Tuple[Optional[float], int, int] -- root (None if f(a) and f(b)
+                                            have the same sign or are
+                                            not finite), numbers of
+                                            f and f' evaluations
+    '''
+    f_a, f_b = float(f(a)), float(f(b))
+    n_f, n_df = 2, 0
+    if f_a == 0:
+        return a, n_f, n_df
+    if f_b == 0:
+        return b, n_f, n_df
+    if f_a * f_b > 0 or not np.isfinite(f_a * f_b):
+        return None, n_f, n_df
+
+    # Orient the bracket so f(lo) < 0 < f(hi)
+    lo, hi = (a, b) if f_a < 0 else (b, a)
+    x = (a + b) / 2
+    dx = dx_old = abs(b - a)
+    f_x, df_x = float(f(x)), float(df(x))
+    n_f, n_df = n_f + 1, n_df + 1
+
+    max_iter = 2 * int(np.ceil(np.log2(max(abs(b - a), eps) / eps))) + 4
+    for _ in range(max_iter):
+        out_of_bracket = ((x - hi) * df_x - f_x) * ((x - lo) * df_x - f_x) > 0
+        if out_of_bracket or abs(2 * f_x) > abs(dx_old * df_x):
+            dx_old, dx = dx, (hi - lo) / 2
+            x = lo + dx
+        else:
+            dx_old, dx = dx, f_x / df_x
+            x -= dx
+
+        if abs(dx) <= eps or abs(hi - lo) <= eps:
+            return x, n_f, n_df
+
+        f_x, df_x = float(f(x)), float(df(x))
+        n_f, n_df = n_f + 1, n_df + 1
+        if f_x == 0:
+            return x, n_f, n_df
+        if f_x < 0:
+            lo = x
+        else:
+            hi = x
+
+    return (lo + hi) / 2, n_f, n_df
+
+
+def sturm_variations(sturm: List[sp.Poly], x: sp.Rational) -> int:
+    '''Sign changes of Sturm sequence at x (zeros skipped)'''
+    signs = [sign for sign in (sp.sign(p.eval(x)) for p in sturm) if sign]
+    return sum(1 for s_1, s_2 in zip(signs, signs[1:]) if s_1 != s_2)
+
+
+def isolate_real_roots(poly: sp.Poly,
+                       bounds: Optional[Tuple[sp.Rational, sp.Rational]] = None
+                       ) -> List[Tuple[sp.Rational, sp.Rational]]:
+    '''Isolate distinct real roots of polynomial with Sturm's theorem
+
+    Number of roots in (a, b] is V(a) - V(b), where V counts sign
+    changes of Sturm sequence. Search interval is bisected in exact
+    rational arithmetic until every part holds one root.
+
+    Arguments:
+        poly {sp.Poly} -- polynomial over QQ of degree 1 or more
+
+    Keyword Arguments:
+        bounds {Optional[Tuple[sp.Rational, sp.Rational]]} -- search
+            interval [a, b] (default: {None}, Cauchy bound of all roots)
+
+    Returns:
+        List[Tuple[sp.Rational, sp.Rational]] -- sorted intervals (a, b]
+                                                 with one root each,
+                                                 (x, x) for exact roots
+    '''
+    sturm = sp.sturm(poly)
+    if bounds is None:
+        coeffs = poly.all_coeffs()
+        bound = 1 + max(abs(c / coeffs[0]) for c in coeffs[1:])
+        bounds = (-bound, bound)
+    variations = partial(sturm_variations, sturm)
+
+    # Sturm counts roots in (a, b], root at a itself is checked apart
+    intervals = [(bounds[0], bounds[0])] if poly.eval(bounds[0]) == 0 else []
+    stack = [bounds]
+    while stack:
+        lo, hi = stack.pop()
+        n_roots = variations(lo) - variations(hi)
+        if n_roots == 1:
+            intervals.append((lo, hi))
+        elif n_roots > 1:
+            mid = (lo + hi) / 2
+            if poly.eval(mid) != 0:
+                stack += [(lo, mid), (mid, hi)]
+                continue
+
+            # Split around exact root, leaving only it in between
+            intervals.append((mid, mid))
+            step = (hi - lo) / 4
+            while variations(mid - step) - variations(mid + step) > 1:
+                step /= 2
+            stack += [(lo, mid - step), (mid + step, hi)]
+
+    return sorted(intervals)
+
+
+def isolate_polynomial(expr: sp.Expr,
+                       x: sp.Symbol) -> Optional[PolynomialRoots]:
+    '''Isolate all real roots of polynomial, no search range needed
+
+    Roots are isolated with Sturm sequences in exact rational
+    arithmetic, starting points are taken from companion matrix
+    eigenvalues (np.roots).
+
+    Arguments:
+        expr {sp.Expr} -- polynomial of x
+        x {sp.Symbol} -- variable
+
+    Returns:
+        Optional[PolynomialRoots] -- exact polynomial, intervals and
+                                     starting points, None if some
+                                     coefficient is irrational
+                                     (sqrt(2), pi, ...)
+    '''
+    domain = sp.Poly(expr, x).domain
+    if domain.is_RR:
+        # Floats are taken as the decimals they were typed as
+        expr = sp.nsimplify(expr, rational=True)
+    elif not (domain.is_ZZ or domain.is_QQ):
+        return None
+    poly = sp.Poly(expr, x, domain='QQ')
+    if poly.degree() < 1:
+        return PolynomialRoots(poly, np.empty(0), [], [])
+
+    eigenvalues = np.roots(np.array(poly.all_coeffs(), dtype=float))
+    return PolynomialRoots(poly, eigenvalues,
+                           *_starting_points(eigenvalues,
+                                             isolate_real_roots(poly)))
+
+
+def _starting_points(eigenvalues: np.ndarray,
+                     intervals: List[Tuple[sp.Rational, sp.Rational]]
+                     ) -> Tuple[List[Tuple[float, float]], List[float]]:
+    '''Float intervals and the most real eigenvalue inside every one
+    (its middle if there is none)'''
+    float_intervals, guesses = [], []
+    for lo, hi in intervals:
+        lo, hi = float(lo), float(hi)
+        float_intervals.append((lo, hi))
+        inside = eigenvalues[(eigenvalues.real >= lo) &
+                             (eigenvalues.real <= hi)]
+        guesses.append(float(inside[np.argmin(abs(inside.imag))].real)
+                       if inside.size else (lo + hi) / 2)
+    return float_intervals, guesses
+
+
+def restrict_roots(roots: PolynomialRoots, a: float,
+                   b: float) -> PolynomialRoots:
+    '''Roots of the same polynomial isolated in [a, b] only,
+    counted and isolated with Sturm sequence of the cached polynomial'''
+    if roots.poly.degree() < 1:
+        return roots
+    intervals = isolate_real_roots(roots.poly,
+                                   (sp.Rational(a), sp.Rational(b)))
+    intervals, guesses = _starting_points(roots.eigenvalues, intervals)
+    return roots._replace(intervals=intervals, guesses=guesses)
+
+
+def polish_roots(f: Callable, df: Callable, roots: PolynomialRoots,
+                 eps: float) -> Tuple[List[float], List[int],
+                                      List[Tuple[int, int]]]:
+    '''Neuton's method from every starting point, kept inside its interval
+
+    Arguments:
+        f {Callable} -- f(x)
+        df {Callable} -- f'(x)
+        roots {PolynomialRoots} -- isolated roots
+        eps {float} -- precision
+
+    Returns:
+        Tuple[List[float], List[int], List[Tuple[int, int]]] -- roots,
+            Neuton iterations and numbers of f and f' evaluations
+    '''
+    polished, iterations, evaluations = [], [], []
+    for (lo, hi), root in zip(roots.intervals, roots.guesses):
+        n_iter = n_f = n_df = 0
+        while lo != hi and n_iter < 100:
+            df_root = df(root)
+            n_df += 1
+            if df_root == 0:
+                break
+            prev_root = root
+            root = min(max(root - f(root) / df_root, lo), hi)
+            n_f += 1
+            n_iter += 1
+            if abs(root - prev_root) <= eps:
+                break
+        polished.append(float(root))
+        iterations.append(n_iter)
+        evaluations.append((n_f, n_df))
+
+    return polished, iterations, evaluations
+
+
 class Lab4():
     def __init__(self, master: tk.Tk) -> None:
         '''Initialize GUI
@@ -44,47 +482,28 @@ class Lab4():
         self.entry_precision.grid(row=3, column=0, columnspan=3)
         self.btn_solve.grid(row=4, column=0, columnspan=3)
 
-    def equation_parser(self) -> sp.Expr:
-        '''Parse entry to sympy Expr type
+    def equation_parser(self) -> ParsedEquation:
+        '''Parse entry, reusing cached result for the same equation
         
         Returns:
-            sp.Expr -- sympy base expression
+            ParsedEquation -- sympy expression with derivatives
         '''
         equ_str = (self.entry_equation
                         .get()
                         .replace(' ', '')
                         .replace('=0', '')) 
-        equ = sp.simplify(equ_str)
-        return equ
-
-    def neuton_method(self, a: float, b: float, eps: float) -> Optional[float]:
-        '''
-        Neuton's method (tangent method) for solving nonlinear equations
-        
-        ''' 
-        sign_a = self.equation.subs(self.x, a) * self.dy_dx_2.subs(self.x, a)
-        prev_x = a if sign_a >= 0 else b
-
-        for _ in range(1000):
-            x = (prev_x -
-                 float(self.equation.subs(self.x, prev_x)) /
-                 float(self.dy_dx_1.subs(self.x, prev_x)))
-
-            if x + 3 < a or x - 3 > b:
-                break
-
-            if abs(x - prev_x) <= eps:
-                return x
-
-            prev_x = x
-
-        return None
+        return parse_equation(equ_str)
 
     def get_results(self,
                     intervals: Optional[List[Tuple[float, float]]]) -> List[float]:
         '''
         Apply Neuton's method on specified intervals
 
+        Neuton iterations spent on every root are kept in self.iterations,
+        numbers of f and f' evaluations (f'' counted as f') of the method
+        which found it in self.evaluations, to compare the cost of
+        Neuton's method with its safeguarded fallback
+
         Arguments:
            intervals {Optional[List[Tuple[float, float]]]} -- search area
         
@@ -92,45 +511,47 @@ class Lab4():
             {List[float]} -- result of Neuton's method
         '''
         if not intervals:
+            self.iterations, self.evaluations = [], []
             return []
 
-        results: List[Optional[float]] = [
-            self.neuton_method(a, b, eps=self.precision)
-            for a, b
-            in intervals
-        ]
-
-        cleaned_result: List[float] = [result for result in results if result]
+        roots, iterations = newton_solve(self.f, self.df, self.d2f,
+                                         intervals, eps=self.precision)
+        # f and f'' at start, then f and f' on every iteration
+        evaluations = np.stack([iterations + 1, iterations + 1], axis=1)
+
+        # Lanes which diverged are solved again with safeguarded method
+        for i in np.flatnonzero(np.isnan(roots)):
+            root, n_f, n_df = safeguarded_newton(self.f, self.df,
+                                                 *intervals[i],
+                                                 eps=self.precision)
+            if root is not None:
+                roots[i] = root
+                evaluations[i] = n_f, n_df
+        found = ~np.isnan(roots)
+        self.iterations = iterations[found].tolist()
+        self.evaluations = [tuple(counts) for counts in
+                            evaluations[found].tolist()]
+
+        cleaned_result: List[float] = roots[found].tolist()
         return cleaned_result
 
     def find_solution_intervals(self,
-                                num_epoch: int=1000,
-                                step: float=1.) -> List[Tuple[float, float]]:
-        '''Tries to find solution itervals 
-        
+                                a: float=-1000.,
+                                b: float=1000.,
+                                step: float=0.1) -> List[Tuple[float, float]]:
+        '''Tries to find solution itervals, see bracket_roots
+
         Right intervals not guararteed
-        
+
         Keyword Arguments:
-            num_epoch {int} -- epochs for searching (default: {1000})
-            step {float} -- increment
-        
+            a {float} -- left end of search range (default: {-1000.})
+            b {float} -- right end of search range (default: {1000.})
+            step {float} -- sampling step (default: {0.1})
+
         Returns:
             List[Tuple[float, float]] -- intervals
         '''
-        intervals: List[Tuple[float, float]] = []
-        a, b = -1000., 1000.
-        n_points_for_search = int((b - a) / step)
-
-        b = a + step
-
-        for _ in range(n_points_for_search):
-            if self.equation.subs(self.x, a) * self.equation.subs(self.x, b) < 0:
-                intervals.append((a, b))
-
-            a = b
-            b += step
-
-        return intervals
+        return bracket_roots(self.f, self.df, a, b, step)
 
     def results_window(self) -> None:
         '''
@@ -176,14 +597,21 @@ class Lab4():
             from_entry {bool} -- where to get intervals (default: {False})
         '''
         self.precision = float(self.entry_precision.get())
-        self.equation = self.equation_parser()
+        parsed = self.equation_parser()
 
         self.x = sp.Symbol('x')
-        self.dy_dx_1 = self.equation.diff()
-        self.dy_dx_2 = self.dy_dx_1.diff()
-
-        intervals = self.find_solution_intervals()
-        self.results = self.get_results(intervals)
+        self.equation = parsed.expr
+        self.dy_dx_1, self.dy_dx_2 = parsed.dy_dx_1, parsed.dy_dx_2
+        self.f, self.df, self.d2f = parsed.f, parsed.df, parsed.d2f
+
+        self.roots = parsed.roots
+        if self.roots is not None:
+            intervals = self.roots.intervals
+            self.results, self.iterations, self.evaluations = polish_roots(
+                self.f, self.df, self.roots, self.precision)
+        else:
+            intervals = self.find_solution_intervals()
+            self.results = self.get_results(intervals)
 
         self.show_results(self.results, intervals)
 
@@ -203,7 +631,12 @@ class Lab4():
                                      parent=self.plot_window)
                 raise ValueError
 
-            result = self.get_results(interval)
+            if self.roots is not None:
+                result, *_ = polish_roots(
+                    self.f, self.df, restrict_roots(self.roots, *interval[0]),
+                    self.precision)
+            else:
+                result = self.get_results(interval)
 
             if result:
                 if (round(result[0], 3) not in list(
@@ -254,9 +687,7 @@ class Lab4():
         else:
             extended_interval = np.linspace(-50, 50, 1000)
 
-        f_values = [self.equation.subs(self.x, x_i)
-                    for x_i
-                    in extended_interval]
+        f_values = self.f(extended_interval)
 
         self.ax.plot(extended_interval, f_values, color='green',
                  label=str(self.equation) + ' = 0', linewidth=2)